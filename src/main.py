@@ -1,6 +1,9 @@
-import base64
-import io
+import asyncio
+import functools
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any
 from mcp.server.fastmcp import FastMCP, Image
 from adbfunc import ADBController
@@ -8,19 +11,52 @@ from PIL import Image as PILImage
 import cv2
 import numpy as np
 
+# libjpeg-turbo encodes JPEG several times faster than OpenCV's bundled
+# encoder; use it when the optional PyTurboJPEG package is available
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _turbo_jpeg = TurboJPEG()
+except Exception:
+    _turbo_jpeg = None
+
 # Initialize FastMCP server
 mcp = FastMCP("MCPEmulatorController")
 
-# Initialize ADB Controller
-adb_controller = ADBController()
-
-# Setup logging
+# Setup logging before the controller starts emitting records
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Initialize ADB Controller
+adb_controller = ADBController()
+
+# Worker pool for blocking adb calls, sized for multi-device fan-out
+_POOL = ThreadPoolExecutor(max_workers=16)
+
+# Fixed response templates for the high-rate input tools; spreading them
+# avoids rebuilding the common keys per call while keeping the dict shape
+# identical for callers
+_OK = {"status": "success"}
+_ERR = {"status": "error"}
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking controller call on the shared worker pool
+
+    Args:
+        fn: Callable to execute
+        *args: Positional arguments for the callable
+        **kwargs: Keyword arguments for the callable
+
+    Returns:
+        The callable's result
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_POOL, functools.partial(fn, *args, **kwargs))
+
 
 def numpy_to_pil_image(img_array: np.ndarray) -> PILImage.Image:
     """
@@ -32,30 +68,103 @@ def numpy_to_pil_image(img_array: np.ndarray) -> PILImage.Image:
     Returns:
         PIL Image object
     """
-    # Convert BGR to RGB
+    # Reverse the channel axis for BGR->RGB: a zero-copy strided view,
+    # unlike cv2.cvtColor which writes a whole new frame
     if len(img_array.shape) == 3:
-        img_rgb = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
+        img_rgb = img_array[:, :, ::-1]
     else:
         img_rgb = img_array
-    
+
     return PILImage.fromarray(img_rgb)
 
 
-def pil_to_base64(img: PILImage.Image, format: str = "PNG") -> str:
+def encode_image(img_array: np.ndarray, fmt: str = "png", quality: int = 80) -> bytes:
     """
-    Convert PIL Image to base64 string
-    
+    Encode a BGR image array to compressed bytes without a PIL round-trip
+
     Args:
-        img: PIL Image object
-        format: Image format (PNG, JPEG, etc.)
-        
+        img_array: OpenCV image array (BGR format)
+        fmt: Output format: "png", "webp" or "jpeg"
+        quality: Encoding quality for jpeg/webp (1-100)
+
+    Returns:
+        Encoded image bytes
+    """
+    if fmt == "jpeg" and _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(img_array, quality=quality, pixel_format=TJPF_BGR)
+    if fmt == "png":
+        ext, params = '.png', [cv2.IMWRITE_PNG_COMPRESSION, 1]
+    elif fmt == "webp":
+        ext, params = '.webp', [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        ext, params = '.jpg', [cv2.IMWRITE_JPEG_QUALITY, quality]
+    ok, buf = cv2.imencode(ext, img_array, params)
+    if not ok:
+        raise RuntimeError(f"{fmt} encoding failed")
+    return buf.tobytes()
+
+
+def _encode_solid_png(color: tuple) -> bytes:
+    """
+    Encode a solid 100x100 BGR color swatch as PNG bytes
+
+    Args:
+        color: BGR color tuple
+
+    Returns:
+        PNG-encoded bytes
+    """
+    return encode_image(np.full((100, 100, 3), color, np.uint8))
+
+
+# Fallback screenshots, encoded once at import instead of per failure
+_BLANK_PNG_BYTES = _encode_solid_png((0, 0, 0))
+_ERROR_PNG_BYTES = _encode_solid_png((0, 0, 255))
+
+# Per-device LRU of encoded screenshots keyed by perceptual hash, so
+# repeated captures of an unchanged screen return the cached encoding
+_SCREENSHOT_CACHE_SIZE = 32
+_screenshot_cache: Dict[str, OrderedDict] = {}
+_screenshot_cache_lock = threading.Lock()
+
+
+def _dhash(img_array: np.ndarray) -> bytes:
+    """
+    Compute a difference hash (dHash) of a frame
+
+    A cheap perceptual fingerprint: downsample to 16x16 grayscale and keep
+    the sign of the horizontal gradients. Visually identical frames hash
+    identically while any real UI change flips bits.
+
+    Args:
+        img_array: OpenCV image array (BGR format)
+
     Returns:
-        Base64 encoded string
+        Hash bytes usable as a cache key
     """
-    buffer = io.BytesIO()
-    img.save(buffer, format=format)
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    return img_str
+    small = cv2.resize(img_array, (16, 16), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return np.packbits(gray[:, 1:] > gray[:, :-1]).tobytes()
+
+
+def _screenshot_cache_get(device: str, cache_key: tuple) -> Optional[bytes]:
+    """Look up an encoded screenshot for a device, refreshing its LRU slot"""
+    with _screenshot_cache_lock:
+        cache = _screenshot_cache.setdefault(device, OrderedDict())
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cache.move_to_end(cache_key)
+        return cached
+
+
+def _screenshot_cache_put(device: str, cache_key: tuple, encoded: bytes):
+    """Store an encoded screenshot for a device, evicting the oldest entry"""
+    with _screenshot_cache_lock:
+        cache = _screenshot_cache.setdefault(device, OrderedDict())
+        cache[cache_key] = encoded
+        cache.move_to_end(cache_key)
+        while len(cache) > _SCREENSHOT_CACHE_SIZE:
+            cache.popitem(last=False)
 
 
 @mcp.tool()
@@ -71,7 +180,7 @@ async def get_devices(enable_mumu: bool = False, mumu_path: str = "D:\\MuMuPlaye
         Dictionary containing device list and status
     """
     try:
-        devices = adb_controller.get_devices(enable_mumu, mumu_path)
+        devices = await _run_blocking(adb_controller.get_devices, enable_mumu, mumu_path)
         logger.info(f"Retrieved {len(devices)} devices")
         
         return {
@@ -98,7 +207,7 @@ async def reload_adb_server() -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.reload_server()
+        await _run_blocking(adb_controller.reload_server)
         logger.info("ADB server reloaded successfully")
         
         return {
@@ -126,7 +235,7 @@ async def setup_tcp_port(device: str, port: int) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.setup_tcp_forward(device, port)
+        await _run_blocking(adb_controller.setup_tcp_forward, device, port)
         logger.info(f"TCP port {port} forwarding setup for device {device}")
         
         return {
@@ -156,7 +265,7 @@ async def get_installed_packages(device: str) -> Dict[str, Any]:
         Dictionary containing package list and status
     """
     try:
-        packages = adb_controller.get_installed_packages(device)
+        packages = await _run_blocking(adb_controller.get_installed_packages, device)
         logger.info(f"Retrieved {len(packages)} packages from device {device}")
         
         return {
@@ -189,7 +298,7 @@ async def launch_application(device: str, package: str) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.launch_app(device, package)
+        await _run_blocking(adb_controller.launch_app, device, package)
         logger.info(f"Launched app {package} on device {device}")
         
         return {
@@ -220,7 +329,7 @@ async def stop_application(device: str, package: str) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.stop_app(device, package)
+        await _run_blocking(adb_controller.stop_app, device, package)
         logger.info(f"Stopped app {package} on device {device}")
         
         return {
@@ -252,21 +361,50 @@ async def tap_screen(device: str, x: int, y: int) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.tap(device, x, y)
+        await _run_blocking(adb_controller.tap, device, x, y)
         logger.info(f"Tapped at ({x}, {y}) on device {device}")
-        
+
+        return {**_OK, "device": device, "x": x, "y": y}
+    except Exception as e:
+        logger.error(f"Failed to tap screen: {e}")
+        return {**_ERR, "device": device, "x": x, "y": y, "error": str(e)}
+
+
+@mcp.tool()
+async def tap_all(devices: List[str], x: int, y: int) -> Dict[str, Any]:
+    """
+    Simulate touch tap on multiple devices concurrently
+
+    Args:
+        devices: List of target device IDs
+        x: X coordinate
+        y: Y coordinate
+
+    Returns:
+        Dictionary containing per-device results and status
+    """
+    try:
+        outcomes = await adb_controller.broadcast('tap', devices, x, y)
+        results = {
+            device: "success" if not isinstance(outcome, Exception) else str(outcome)
+            for device, outcome in zip(devices, outcomes)
+        }
+        logger.info(f"Tapped at ({x}, {y}) on {len(devices)} devices")
+
         return {
-            "device": device,
+            "devices": devices,
             "x": x,
             "y": y,
+            "results": results,
             "status": "success"
         }
     except Exception as e:
-        logger.error(f"Failed to tap screen: {e}")
+        logger.error(f"Failed to tap devices: {e}")
         return {
-            "device": device,
+            "devices": devices,
             "x": x,
             "y": y,
+            "results": {},
             "status": "error",
             "error": str(e)
         }
@@ -287,75 +425,77 @@ async def swipe_screen(device: str, x1: int, y1: int, x2: int, y2: int, duration
         Status dictionary
     """
     try:
-        adb_controller.swipe(device, x1, y1, x2, y2, duration)
+        await _run_blocking(adb_controller.swipe, device, x1, y1, x2, y2, duration)
         logger.info(f"Swiped from ({x1}, {y1}) to ({x2}, {y2}) on device {device}")
-        
-        return {
-            "device": device,
-            "start_x": x1,
-            "start_y": y1,
-            "end_x": x2,
-            "end_y": y2,
-            "duration": duration,
-            "status": "success"
-        }
+
+        return {**_OK, "device": device, "start_x": x1, "start_y": y1,
+                "end_x": x2, "end_y": y2, "duration": duration}
     except Exception as e:
         logger.error(f"Failed to swipe screen: {e}")
-        return {
-            "device": device,
-            "start_x": x1,
-            "start_y": y1,
-            "end_x": x2,
-            "end_y": y2,
-            "duration": duration,
-            "status": "error",
-            "error": str(e)
-        }
+        return {**_ERR, "device": device, "start_x": x1, "start_y": y1,
+                "end_x": x2, "end_y": y2, "duration": duration, "error": str(e)}
 
 
 @mcp.tool()
-async def capture_screenshot(device: str, save_path: Optional[str] = None) -> Image:
+async def capture_screenshot(device: str, save_path: Optional[str] = None,
+                             fmt: str = "jpeg", quality: int = 80,
+                             max_size: Optional[int] = None) -> Image:
     """
     Capture screenshot from device and return as image
-    
+
     Args:
         device: Target device ID
         save_path: Optional path to save screenshot file
-        
+        fmt: Output format: "jpeg" (default), "webp" or "png"; the lossy
+            formats encode much faster and produce far smaller payloads,
+            use "png" when lossless output is required
+        quality: Encoding quality for jpeg/webp (1-100)
+        max_size: Optional longest-side limit in pixels; the screenshot is
+            downscaled to fit before encoding (e.g. 100 for a thumbnail)
+
     Returns:
         MCP Image object containing the screenshot
     """
     try:
         # Capture screen as numpy array
-        screen_array = adb_controller.capture_screen(device, save_path)
+        screen_array = await _run_blocking(adb_controller.capture_screen, device, save_path)
         
         if screen_array is None:
             logger.error(f"Failed to capture screen from device {device}")
-            # Return a blank image as fallback
-            blank_img = PILImage.new('RGB', (100, 100), color='black')
-            buffer = io.BytesIO()
-            blank_img.save(buffer, format='PNG')
-            return Image(data=buffer.getvalue(), format="png")
-        
-        # Convert numpy array to PIL Image
-        pil_image = numpy_to_pil_image(screen_array)
-        
-        # Convert to PNG bytes
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format='PNG')
-        image_bytes = buffer.getvalue()
-        
+            # Return the precomputed blank image as fallback
+            return Image(data=_BLANK_PNG_BYTES, format="png")
+        
+        if fmt not in ("png", "webp"):
+            fmt = "jpeg"
+
+        # Skip re-encoding when the screen hasn't visibly changed since a
+        # recent capture (idle screens are common in polling workflows)
+        cache_key = (_dhash(screen_array), max_size, fmt, quality)
+        cached = _screenshot_cache_get(device, cache_key)
+        if cached is not None:
+            logger.info(f"Screenshot unchanged on device {device}, returning cached encoding")
+            return Image(data=cached, format=fmt)
+
+        # Downscale before encoding when a thumbnail was requested;
+        # INTER_AREA is the right filter for shrinking and is SIMD-optimized
+        if max_size:
+            h, w = screen_array.shape[:2]
+            scale = max_size / max(h, w)
+            if scale < 1:
+                screen_array = cv2.resize(screen_array, (int(w * scale), int(h * scale)),
+                                          interpolation=cv2.INTER_AREA)
+
+        image_bytes = encode_image(screen_array, fmt, quality)
+        _screenshot_cache_put(device, cache_key, image_bytes)
+
         logger.info(f"Screenshot captured from device {device}")
-        
-        return Image(data=image_bytes, format="png")
+
+        return Image(data=image_bytes, format=fmt)
         
     except Exception as e:
         logger.error(f"Failed to capture screenshot: {e}")
-        # Return a blank image as fallback
-        blank_img = PILImage.new('RGB', (100, 100), color='red')
-        buffer = io.BytesIO()
-        blank_img.save(buffer, format='PNG')
-        return Image(data=buffer.getvalue(), format="png")
+        # Return the precomputed error image as fallback
+        return Image(data=_ERROR_PNG_BYTES, format="png")
 
 
 @mcp.tool()
@@ -371,22 +511,13 @@ async def type_text_on_device(device: str, text: str) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.type_text(device, text)
+        await _run_blocking(adb_controller.type_text, device, text)
         logger.info(f"Typed text on device {device}")
-        
-        return {
-            "device": device,
-            "text_length": len(text),
-            "status": "success"
-        }
+
+        return {**_OK, "device": device, "text_length": len(text)}
     except Exception as e:
         logger.error(f"Failed to type text: {e}")
-        return {
-            "device": device,
-            "text_length": len(text),
-            "status": "error",
-            "error": str(e)
-        }
+        return {**_ERR, "device": device, "text_length": len(text), "error": str(e)}
 
 
 @mcp.tool()
@@ -402,22 +533,13 @@ async def send_key_event(device: str, key_code: int) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.send_key_event(device, key_code)
+        await _run_blocking(adb_controller.send_key_event, device, key_code)
         logger.info(f"Sent key event {key_code} to device {device}")
-        
-        return {
-            "device": device,
-            "key_code": key_code,
-            "status": "success"
-        }
+
+        return {**_OK, "device": device, "key_code": key_code}
     except Exception as e:
         logger.error(f"Failed to send key event: {e}")
-        return {
-            "device": device,
-            "key_code": key_code,
-            "status": "error",
-            "error": str(e)
-        }
+        return {**_ERR, "device": device, "key_code": key_code, "error": str(e)}
 
 
 @mcp.tool()
@@ -433,7 +555,7 @@ async def install_application(device: str, apk_path: str) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.install_app(device, apk_path)
+        await _run_blocking(adb_controller.install_app, device, apk_path)
         logger.info(f"Installed app from {apk_path} on device {device}")
         
         return {
@@ -464,7 +586,7 @@ async def uninstall_application(device: str, package: str) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.uninstall_app(device, package)
+        await _run_blocking(adb_controller.uninstall_app, device, package)
         logger.info(f"Uninstalled app {package} from device {device}")
         
         return {
@@ -496,7 +618,7 @@ async def push_file_to_device(device: str, local_path: str, remote_path: str) ->
         Status dictionary
     """
     try:
-        adb_controller.push_file(device, local_path, remote_path)
+        await _run_blocking(adb_controller.push_file, device, local_path, remote_path)
         logger.info(f"Pushed file {local_path} to {remote_path} on device {device}")
         
         return {
@@ -530,7 +652,7 @@ async def pull_file_from_device(device: str, remote_path: str, local_path: str)
         Status dictionary
     """
     try:
-        adb_controller.pull_file(device, remote_path, local_path)
+        await _run_blocking(adb_controller.pull_file, device, remote_path, local_path)
         logger.info(f"Pulled file {remote_path} to {local_path} from device {device}")
         
         return {
@@ -563,9 +685,9 @@ async def check_app_status(device: str, package: str) -> Dict[str, Any]:
         Dictionary containing app status information
     """
     try:
-        is_installed = adb_controller.is_app_installed(device, package)
-        is_running = adb_controller.is_app_running(device, package) if is_installed else False
-        
+        # One combined probe instead of separate installed/running calls
+        is_installed, is_running = await _run_blocking(adb_controller.get_app_status, device, package)
+
         return {
             "device": device,
             "package": package,
@@ -598,7 +720,7 @@ async def open_url_on_device(device: str, url: str) -> Dict[str, Any]:
         Status dictionary
     """
     try:
-        adb_controller.open_url(device, url)
+        await _run_blocking(adb_controller.open_url, device, url)
         logger.info(f"Opened URL {url} on device {device}")
         
         return {
@@ -630,7 +752,8 @@ async def find_image_on_screen(device: str, template_path: str, threshold: float
         Dictionary containing match coordinates and confidence
     """
     try:
-        match_result = adb_controller.find_image_on_screen(device, template_path, threshold)
+        match_result = await _run_blocking(adb_controller.find_image_on_screen,
+                                               device, template_path, threshold)
         
         if match_result:
             x, y = match_result
@@ -679,25 +802,31 @@ async def get_device_info(device: str) -> Dict[str, Any]:
         Dictionary containing device information
     """
     try:
-        # Get basic device properties
+        # Read all properties with one adb shell invocation instead of six;
+        # the per-call subprocess overhead dominates these tiny reads
+        prop_names = ["model", "brand", "version", "sdk", "resolution", "density"]
+        batch_command = (
+            "getprop ro.product.model; echo ---; "
+            "getprop ro.product.brand; echo ---; "
+            "getprop ro.build.version.release; echo ---; "
+            "getprop ro.build.version.sdk; echo ---; "
+            "wm size; echo ---; "
+            "wm density"
+        )
+
+        try:
+            output = await _run_blocking(adb_controller._run_adb_command,
+                                             ["shell", batch_command], device,
+                                             capture_output=True)
+            values = [part.strip() for part in output.split('---')]
+        except Exception:
+            values = []
+
         properties = {}
-        
-        prop_commands = {
-            "model": "shell getprop ro.product.model",
-            "brand": "shell getprop ro.product.brand",
-            "version": "shell getprop ro.build.version.release",
-            "sdk": "shell getprop ro.build.version.sdk",
-            "resolution": "shell wm size",
-            "density": "shell wm density"
-        }
-        
-        for prop_name, command in prop_commands.items():
-            try:
-                result = adb_controller._run_adb_command(command, device, capture_output=True)
-                properties[prop_name] = result.strip() if result else "Unknown"
-            except:
-                properties[prop_name] = "Unknown"
-        
+        for i, prop_name in enumerate(prop_names):
+            value = values[i] if i < len(values) else ""
+            properties[prop_name] = value or "Unknown"
+
         return {
             "device": device,
             "properties": properties,